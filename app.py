@@ -1,88 +1,327 @@
 import gradio as gr
-import subprocess
+import ast
+import asyncio
+import concurrent.futures
+import functools
+import itertools
+import multiprocessing
+import threading
 import os
 import tempfile
 import shutil
 from pathlib import Path
+from glob import glob
 import time
-import sys
 import re
+import atexit
+import hashlib
 import manim
+import numpy as np
 import requests
-import json
+from requests.adapters import HTTPAdapter, Retry
+import orjson
 
 API_KEY = os.environ.get("API_KEY")
 
+# One shared session keeps TCP+TLS connections to fal.run alive across
+# calls instead of paying a fresh handshake per request, and retries
+# transient gateway errors.
+_SESSION = requests.Session()
+_SESSION.headers.update({
+    "Content-Type": "application/json",
+    "Authorization": f"Key {API_KEY}"
+})
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    # allowed_methods=None opts POST in: urllib3's default method list
+    # excludes it, which would make the status retries a no-op for
+    # every call this app sends.
+    max_retries=Retry(
+        total=2,
+        backoff_factor=0.3,
+        status_forcelist=[502, 503, 504],
+        allowed_methods=None,
+    ),
+))
+
+# Exact-match cache for LLM calls: identical prompts (e.g. the Gradio
+# Examples) skip the API round-trip entirely and return instantly.
+_PROMPT_CACHE = {}
+_PROMPT_CACHE_MAX = 512
+
+
+def _prompt_cache_key(**fields):
+    """Stable cache key for an LLM call (sha256 of the sorted fields)."""
+    return hashlib.sha256(
+        orjson.dumps(fields, option=orjson.OPT_SORT_KEYS)
+    ).hexdigest()
+
+
+def _prompt_cache_put(key, value):
+    """Store a result, evicting the oldest entry once the cache is full."""
+    if len(_PROMPT_CACHE) >= _PROMPT_CACHE_MAX:
+        # Two threads can race to evict the same oldest key; pop with a
+        # default so the loser is a no-op instead of a KeyError.
+        oldest = next(iter(_PROMPT_CACHE), None)
+        if oldest is not None:
+            _PROMPT_CACHE.pop(oldest, None)
+    _PROMPT_CACHE[key] = value
+
+
+# Semantic cache: users phrase the same animation many ways
+# ("explain (a+b)^2" vs "visualize (a+b) squared"), so on top of the
+# exact-match cache we embed prompts with a small local model and reuse
+# the generated code when a previous prompt is close enough.
+_SEM_THRESHOLD = 0.92
+_SEM_CACHE_FILE = os.path.join(
+    os.path.expanduser("~"), ".cache", "anim-vid-ai", "cache.npz"
+)
+_SEM_PROMPTS = []
+_SEM_CODES = []
+_SEM_EMBS = None  # np.ndarray of shape [N, 384], L2-normalized rows
+# The three structures above move in lockstep; concurrent pipelines hit
+# them from asyncio.to_thread workers, so every read/write of the triple
+# holds this lock to keep the indices aligned.
+_SEM_LOCK = threading.Lock()
+_EMBEDDER = None
+
+
+def _get_embedder():
+    """Load the sentence-transformer once; None if the package is missing."""
+    global _EMBEDDER
+    if _EMBEDDER is None:
+        try:
+            from sentence_transformers import SentenceTransformer
+            _EMBEDDER = SentenceTransformer(
+                "sentence-transformers/all-MiniLM-L6-v2"
+            )
+        except Exception as e:
+            print(f"Semantic cache disabled (embedder unavailable): {e}")
+            _EMBEDDER = False
+    return _EMBEDDER or None
+
+
+def _semantic_cache_load():
+    """Warm-start the semantic cache from disk if a previous run saved one."""
+    global _SEM_PROMPTS, _SEM_CODES, _SEM_EMBS
+    try:
+        if os.path.exists(_SEM_CACHE_FILE):
+            data = np.load(_SEM_CACHE_FILE, allow_pickle=True)
+            _SEM_PROMPTS = list(data["prompts"])
+            _SEM_CODES = list(data["codes"])
+            _SEM_EMBS = data["embs"]
+    except Exception as e:
+        print(f"Could not load semantic cache: {e}")
+
+
+def _semantic_cache_save():
+    """Persist the semantic cache so warm starts can reuse it."""
+    if not _SEM_PROMPTS:
+        return
+    try:
+        os.makedirs(os.path.dirname(_SEM_CACHE_FILE), exist_ok=True)
+        with _SEM_LOCK:
+            np.savez(
+                _SEM_CACHE_FILE,
+                prompts=np.array(_SEM_PROMPTS, dtype=object),
+                codes=np.array(_SEM_CODES, dtype=object),
+                embs=_SEM_EMBS,
+            )
+    except Exception as e:
+        print(f"Could not save semantic cache: {e}")
+
+
+def _semantic_cache_get(prompt):
+    """Return (matched_prompt, code) for a near-duplicate prompt, or None."""
+    embedder = _get_embedder()
+    if embedder is None:
+        return None
+    # Encoding is the slow part; keep it outside the lock.
+    e = embedder.encode([prompt], normalize_embeddings=True)[0]
+    with _SEM_LOCK:
+        if _SEM_EMBS is None or not len(_SEM_PROMPTS):
+            return None
+        sims = _SEM_EMBS @ e
+        best = int(np.argmax(sims))
+        if sims[best] > _SEM_THRESHOLD:
+            return _SEM_PROMPTS[best], _SEM_CODES[best]
+    return None
+
+
+def _semantic_cache_put(prompt, code):
+    global _SEM_EMBS
+    embedder = _get_embedder()
+    if embedder is None:
+        return
+    e = embedder.encode([prompt], normalize_embeddings=True)
+    with _SEM_LOCK:
+        _SEM_PROMPTS.append(prompt)
+        _SEM_CODES.append(code)
+        _SEM_EMBS = e if _SEM_EMBS is None else np.vstack([_SEM_EMBS, e])
+
+
+_semantic_cache_load()
+atexit.register(_semantic_cache_save)
+
+
+# System prompts are module constants with no per-request interpolation:
+# an identical static prefix across calls keeps them eligible for
+# provider-side prompt caching (the user prompt travels only in the
+# payload's "prompt" field).
+_SYSTEM_PROMPT = """
+You are a senior math educator and Manim Community v0.19 expert.
+Write a Manim script in Python to visualize the user's request. FOCUS on producing working code. Always use Manim Community version 0.19 syntax. When creating an Axes object, do not use axis_color directly as a keyword argument. Instead, use axis_config= 'color': ... The class should be MyScene and end with self.wait(). Class name should be MyScene. End with self.wait() Only give me the python code so that I can directly put this into the manim project input.
+Avoid using deprecated or unavailable ManimCE methods like get_tangent_line. Construct tangent lines manually using slope and Line(...).
+Always ensure visuals are well spaced, readable, never overlapping.
+make sure video scene doesn't overlap and shown inside the canvas.
+Text should be placed carefully using `.animate.to_edge()`, `.next_to()`, or `.shift()`.
+Only include coordinate axes, graphs, tangent lines, or shapes if necessary.
+Always conclude with `self.wait()`.
+Use ManimCE v0.19 syntax.
+The scene class should always be named `MyScene`.
+"""
+
+_EDIT_SYSTEM_PROMPT = """
+You are a Manim expert. You will receive existing Manim code and an instruction on how to modify it.
+Follow these rules:
+- Only modify what’s necessary.
+- Maintain compatibility with Manim Community v0.19.
+- Always return full corrected Python code in a ```python``` block.
+- The class name must remain unchanged.
+- Always end with self.wait().
+"""
+
+
+# Compiled once at import so per-click calls skip the re-compile/cache
+# lookup and the line-splitting allocations.
+_CODE_START = re.compile(r"^(?:from |import |class )", re.M)
+_ERR_RE = re.compile(r"ERROR|Traceback|\w+Error")
+
+
+def _bounded_logs(text, max_lines=200):
+    """
+    Trim process output before it reaches the UI: keep every line that
+    looks like an error plus the last max_lines lines, instead of
+    shipping megabytes of progress bars over the websocket.
+    """
+    lines = text.splitlines()
+    if len(lines) <= max_lines:
+        return text
+    tail = lines[-max_lines:]
+    tail_set = set(tail)
+    errors = [l for l in lines[:-max_lines] if _ERR_RE.search(l) and l not in tail_set]
+    return "\n".join(errors + ["... (log truncated) ..."] + tail)
+
 
 def extract_manim_code(ai_text):
     """
     Extract Manim Python code from AI text.
-    - If a ```python block exists, extract it.
+    - If a ```python block exists, extract it. A still-open fence
+      (mid-stream output) yields everything after the opening fence, so
+      partial responses extract cleanly too.
     - Otherwise, remove any leading text before 'import' or 'class Scene'.
     """
-    # Try Markdown-style Python block first
-    match = re.search(r"```python\s*(.*?)```", ai_text, re.DOTALL)
+    # Try Markdown-style Python block first: two find() calls instead of
+    # a backtracking DOTALL regex over the whole response.
+    i = ai_text.find("```python")
+    if i >= 0:
+        i += len("```python")
+        j = ai_text.find("```", i)
+        return (ai_text[i:j] if j >= 0 else ai_text[i:]).strip()
+
+    # Otherwise, drop any leading text before the first code-looking line
+    match = _CODE_START.search(ai_text)
     if match:
-        return match.group(1).strip()
-    
-    # Otherwise, try to find the first line that looks like Python code
-    lines = ai_text.splitlines()
-    for i, line in enumerate(lines):
-        if line.strip().startswith(("from ", "import ", "class ")):
-            return "\n".join(lines[i:]).strip()
-    
+        return ai_text[match.start():].strip()
+
     # fallback: return entire text
     return ai_text.strip()
 
 
-def generate_code_from_prompt(prompt, progress=gr.Progress()):
+_API_URL = "https://fal.run/fal-ai/any-llm"
+
+
+def stream_code_from_prompt(prompt):
     """
-    Calls the Fal AI Any LLM API to generate Python Manim code.
+    Stream Manim code for a prompt, yielding (code, status) tuples.
+
+    Intermediate yields carry status None while tokens arrive so the UI
+    can show code as it is generated; the final yield carries the
+    definitive (code, status) pair. Cached results are yielded in one
+    shot. If the streaming endpoint fails, falls back to the regular
+    one-shot API call.
     """
-    progress(0, desc="Sending request to AI API...")
+    cache_key = _prompt_cache_key(
+        fn="generate",
+        model="google/gemini-3-flash-preview",
+        prompt=prompt,
+    )
+    cached = _PROMPT_CACHE.get(cache_key)
+    if cached is not None:
+        yield cached
+        return
+
+    semantic_hit = _semantic_cache_get(prompt)
+    if semantic_hit is not None:
+        matched_prompt, code = semantic_hit
+        yield code, f"✅ Reused code from a similar prompt: '{matched_prompt}'"
+        return
 
-    api_url = "https://fal.run/fal-ai/any-llm"
-    
     payload = {
         "prompt": prompt,
         "priority": "latency",
         "model": "google/gemini-3-flash-preview",
-        "system_prompt": f"""
-Write a Manim script that's in Python to visualize: {prompt}. FOCUS on producing working code. Always use Manim Community version 0.19 syntax. When creating an Axes object, do not use axis_color directly as a keyword argument. Instead, use axis_config= 'color': ... The class should be MyScene and end with self.wait(). Class name should be MyScene. End with self.wait() Only give me the python code so that I can directly put this into the manim project input. 
-Avoid using deprecated or unavailable ManimCE methods like get_tangent_line. Construct tangent lines manually using slope and Line(...).
-You are a senior math educator and Manim Community v0.19 expert.
-Always ensure visuals are well spaced, readable, never overlapping.
-make sure video scene doesn't overlap and shown inside the canvas.
-Text should be placed carefully using `.animate.to_edge()`, `.next_to()`, or `.shift()`.
-Only include coordinate axes, graphs, tangent lines, or shapes if necessary.
-Always conclude with `self.wait()`.
-Use ManimCE v0.19 syntax.
-The scene class should always be named `MyScene`.
-"""
+        "system_prompt": _SYSTEM_PROMPT
     }
 
+    generated_text = ""
     try:
-        headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Key {API_KEY}"
-        }
-        response = requests.post(api_url, headers=headers, data=json.dumps(payload), timeout=60)
-        response.raise_for_status()
-        result = response.json()
-        
-        # Extract generated text
-        generated_text = result.get("output", "")
-        if not generated_text:
-            return "", "❌ No code generated from AI."
+        with _SESSION.post(_API_URL + "/stream", data=orjson.dumps(payload), stream=True, timeout=60) as response:
+            response.raise_for_status()
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                try:
+                    event = orjson.loads(line[len("data:"):])
+                except ValueError:
+                    continue
+                generated_text = event.get("output") or generated_text
+                yield extract_manim_code(generated_text), None
+    except Exception:
+        # Streaming endpoint unavailable — fall back to the one-shot call.
+        try:
+            response = _SESSION.post(_API_URL, data=orjson.dumps(payload), timeout=60)
+            response.raise_for_status()
+            generated_text = orjson.loads(response.content).get("output", "")
+        except Exception as e:
+            yield "", f"❌ Failed to generate code: {str(e)}"
+            return
 
-        # Extract Python code block safely
-        cleaned_code = extract_manim_code(generated_text)
+    if not generated_text:
+        yield "", "❌ No code generated from AI."
+        return
 
-        progress(1.0, desc="✅ AI code generation complete!")
-        return cleaned_code, f"✅ AI code generated successfully for: '{prompt}'"
+    cleaned_code = extract_manim_code(generated_text)
+    result = cleaned_code, f"✅ AI code generated successfully for: '{prompt}'"
+    _prompt_cache_put(cache_key, result)
+    _semantic_cache_put(prompt, cleaned_code)
+    yield result
 
-    except Exception as e:
-        return "", f"❌ Failed to generate code: {str(e)}"
+
+def generate_code_from_prompt(prompt, progress=gr.Progress()):
+    """
+    Calls the Fal AI Any LLM API to generate Python Manim code.
+    """
+    progress(0, desc="Sending request to AI API...")
+
+    code, status = "", "❌ No code generated from AI."
+    for code, status in stream_code_from_prompt(prompt):
+        if status is None:
+            progress(0.5, desc="Streaming code from AI...")
+
+    progress(1.0, desc="✅ AI code generation complete!")
+    return code, status
 
 
 def edit_code_with_instruction(existing_code, instruction, progress=gr.Progress()):
@@ -92,33 +331,28 @@ def edit_code_with_instruction(existing_code, instruction, progress=gr.Progress(
     """
     progress(0, desc="Sending edit request to AI API...")
 
-    api_url = "https://fal.run/fal-ai/any-llm"
-
-    system_prompt = f"""
-You are a Manim expert. You will receive existing Manim code and an instruction on how to modify it.
-Follow these rules:
-- Only modify what’s necessary.
-- Maintain compatibility with Manim Community v0.19.
-- Always return full corrected Python code in a ```python``` block.
-- The class name must remain unchanged.
-- Always end with self.wait().
-"""
+    cache_key = _prompt_cache_key(
+        fn="edit",
+        model="google/gemini-3-flash-preview",
+        code=existing_code,
+        instruction=instruction,
+    )
+    cached = _PROMPT_CACHE.get(cache_key)
+    if cached is not None:
+        progress(1.0, desc="✅ Loaded from cache!")
+        return cached
 
     payload = {
         "prompt": f"Instruction: {instruction}\n\nOriginal Code:\n```python\n{existing_code}\n```",
         "priority": "latency",
         "model": "google/gemini-3-flash-preview",
-        "system_prompt": system_prompt
+        "system_prompt": _EDIT_SYSTEM_PROMPT
     }
 
     try:
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Key {API_KEY}"
-        }
-        response = requests.post(api_url, headers=headers, data=json.dumps(payload), timeout=60)
+        response = _SESSION.post(_API_URL, data=orjson.dumps(payload), timeout=60)
         response.raise_for_status()
-        result = response.json()
+        result = orjson.loads(response.content)
 
         ai_text = result.get("output", "")
         if not ai_text:
@@ -127,7 +361,9 @@ Follow these rules:
         cleaned_code = extract_manim_code(ai_text)
 
         progress(1.0, desc="✅ Code edited successfully!")
-        return cleaned_code, "✅ Code updated based on your instruction."
+        result = cleaned_code, "✅ Code updated based on your instruction."
+        _prompt_cache_put(cache_key, result)
+        return result
 
     except Exception as e:
         return "", f"❌ Failed to edit code: {str(e)}"
@@ -136,40 +372,335 @@ Follow these rules:
 
 
 
+# Rendered-output cache: hitting "Re-render" (or re-submitting an
+# example prompt) with unchanged code skips Manim entirely and serves
+# the previous file. Deliberately separate from MANIM_CACHE_DIR, which
+# Manim itself owns.
+_RENDER_CACHE_DIR = "/tmp/anim_render_cache"
+_RENDER_CACHE_MAX_BYTES = 500 * 1024 * 1024
+
+
+def _render_cache_key(code, quality, format_type):
+    return hashlib.sha256(
+        f"{quality}|{format_type}|{code.strip()}".encode()
+    ).hexdigest()
+
+
+def _render_cache_evict():
+    """Drop the oldest cached renders once the cache exceeds its budget."""
+    try:
+        entries = []
+        for name in os.listdir(_RENDER_CACHE_DIR):
+            path = os.path.join(_RENDER_CACHE_DIR, name)
+            st = os.stat(path)
+            entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= _RENDER_CACHE_MAX_BYTES:
+                break
+            os.remove(path)
+            total -= size
+    except OSError:
+        pass
+
+
+@functools.lru_cache(maxsize=64)
+def _analyze_code(code):
+    """
+    Parse the code once with ast and answer both validation questions:
+    returns (is_valid, message, scene_class_names). Memoized because
+    the same string gets analyzed for validation and class extraction
+    on every render (and again on re-renders).
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        return False, f"Code is not valid Python: {e}", ()
+
+    imports_manim = any(
+        (isinstance(node, ast.ImportFrom) and node.module == "manim")
+        or (isinstance(node, ast.Import) and any(a.name == "manim" for a in node.names))
+        for node in tree.body
+    )
+    scene_classes = tuple(
+        node.name
+        for node in tree.body
+        if isinstance(node, ast.ClassDef) and any(
+            (isinstance(base, ast.Name) and base.id.endswith("Scene"))
+            or (isinstance(base, ast.Attribute) and base.attr.endswith("Scene"))
+            for base in node.bases
+        )
+    )
+
+    if not imports_manim:
+        return False, "Code must include 'from manim import *' or 'import manim'", scene_classes
+    if not scene_classes:
+        return False, "Code must contain a class inheriting from Scene or a Scene subclass", scene_classes
+    return True, "Code validation passed", scene_classes
+
+
+def _manim_worker_main(job_q, result_q, cancelled, running):
+    """
+    Long-lived render worker: pays the heavy manim/numpy/cairo import
+    once at startup, then renders jobs sent over the queue. Runs in its
+    own process so a crashing scene never takes down the app. Jobs
+    whose id appears in the shared `cancelled` dict are skipped.
+    """
+    import importlib.util
+    import logging
+    import traceback
+    from collections import deque
+
+    from manim import tempconfig
+    from manim import logger as manim_logger
+
+    # Ring buffer for the log tail, plus a small side buffer so error
+    # lines survive even after scrolling out of the tail.
+    tail = deque(maxlen=200)
+    errors = deque(maxlen=50)
+
+    class _TailHandler(logging.Handler):
+        def emit(self, record):
+            msg = self.format(record)
+            tail.append(msg)
+            if _ERR_RE.search(msg):
+                errors.append(msg)
+
+    manim_logger.addHandler(_TailHandler())
+
+    def collect_logs():
+        in_tail = set(tail)
+        return "\n".join([l for l in errors if l not in in_tail] + list(tail))
+
+    while True:
+        job = job_q.get()
+        if job is None:
+            break
+        if cancelled.pop(job["id"], None):
+            continue
+        tail.clear()
+        errors.clear()
+        # Announce what we are rendering through the manager dict (a
+        # synchronous call, unlike a buffered queue put), so the parent
+        # knows which job to fail if this process dies mid-render.
+        running[os.getpid()] = job["id"]
+        try:
+            with tempconfig(job["config"]):
+                spec = importlib.util.spec_from_file_location(job["module"], job["file"])
+                module = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(module)
+                scene = getattr(module, job["class_name"])()
+                scene.render()
+                output = str(scene.renderer.file_writer.movie_file_path)
+            result_q.put((job["id"], True, output, collect_logs()))
+        except KeyboardInterrupt:
+            raise
+        except BaseException:
+            # BaseException, not Exception: generated code calling
+            # sys.exit()/quit() raises SystemExit, which would otherwise
+            # kill the worker and silently shrink the pool.
+            logs = collect_logs() + "\n" + traceback.format_exc()
+            result_q.put((job["id"], False, None, logs))
+        finally:
+            running.pop(os.getpid(), None)
+
+
+class ManimWorkerPool:
+    """
+    Small pool of pre-forked render workers with Manim already imported,
+    removing the ~1-2s interpreter + import cost that spawning
+    `python -m manim` paid on every render.
+    """
+
+    def __init__(self, size=2):
+        self.size = size
+        self.job_q = multiprocessing.Queue()
+        self.result_q = multiprocessing.Queue()
+        self.workers = []
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+        self._started = False
+        self._manager = None
+        self._cancelled = None
+        self._running = None
+
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+        # Shared dicts of cancelled job ids and of which job each worker
+        # pid is rendering; created lazily so importing the module does
+        # not spawn a manager process.
+        self._manager = multiprocessing.Manager()
+        self._cancelled = self._manager.dict()
+        self._running = self._manager.dict()
+        for _ in range(self.size):
+            self._spawn()
+        self._start_collector()
+        threading.Thread(target=self._watch_workers, daemon=True).start()
+
+    def _spawn(self):
+        proc = multiprocessing.Process(
+            target=_manim_worker_main,
+            args=(self.job_q, self.result_q, self._cancelled, self._running),
+            daemon=True,
+        )
+        proc.start()
+        self.workers.append(proc)
+
+    def _start_collector(self):
+        threading.Thread(target=self._collect, args=(self.result_q,), daemon=True).start()
+
+    def _collect(self, result_q):
+        while True:
+            try:
+                msg = result_q.get()
+            except (EOFError, OSError):
+                return
+            if msg is None:
+                # restart() retired this queue — any real results ahead
+                # of the sentinel were drained above, and this collector
+                # belongs to the previous generation, so it can exit.
+                return
+            job_id, ok, output, logs = msg
+            with self._lock:
+                entry = self._pending.pop(job_id, None)
+            self._cancelled.pop(job_id, None)  # job finished anyway
+            if entry is not None:
+                future, _ = entry
+                if not future.done():
+                    future.set_result((ok, output, logs))
+
+    def _watch_workers(self):
+        """
+        Respawn workers that died outright (a cairo/latex segfault,
+        os._exit in generated code). Without this the pool silently
+        shrinks until every render waits out the full timeout; the dead
+        worker's in-flight job is failed promptly instead.
+        """
+        while True:
+            time.sleep(1)
+            died = []
+            with self._lock:
+                for proc in list(self.workers):
+                    if proc.is_alive():
+                        continue
+                    self.workers.remove(proc)
+                    job_id = self._running.pop(proc.pid, None)
+                    entry = self._pending.pop(job_id, None) if job_id is not None else None
+                    if entry is not None:
+                        died.append((proc.exitcode, entry))
+                    self._spawn()
+            for exitcode, (future, _) in died:
+                if not future.done():
+                    future.set_result((
+                        False, None,
+                        f"Render worker died mid-render (exit code {exitcode}); "
+                        "a replacement worker was started",
+                    ))
+
+    def submit(self, job):
+        """Queue a render job; returns (job_id, Future of (ok, output, logs))."""
+        self.start()
+        job_id = next(self._counter)
+        future = concurrent.futures.Future()
+        with self._lock:
+            self._pending[job_id] = (future, job)
+            self.job_q.put(dict(job, id=job_id))
+        return job_id, future
+
+    def cancel(self, job_id):
+        """Mark a job cancelled so a worker skips it if it hasn't started."""
+        with self._lock:
+            entry = self._pending.pop(job_id, None)
+        if entry is None:
+            return
+        self._cancelled[job_id] = True
+        future, _ = entry
+        if not future.done():
+            future.cancel()
+
+    def restart(self, timed_out=None):
+        """
+        Replace the workers after a stuck render. Only the timed-out
+        job fails; jobs still pending are re-submitted to the fresh
+        workers. The queues are recreated too — terminating a process
+        mid-put/get can corrupt a multiprocessing.Queue.
+        """
+        with self._lock:
+            for proc in self.workers:
+                proc.terminate()
+            self.workers = []
+            self._running.clear()
+            pending, self._pending = self._pending, {}
+            old_job_q, old_result_q = self.job_q, self.result_q
+            self.job_q = multiprocessing.Queue()
+            self.result_q = multiprocessing.Queue()
+            # Wake the old collector with a sentinel so its thread exits
+            # instead of blocking on the retired queue forever, then
+            # close our ends of both old queues.
+            old_result_q.put(None)
+            old_job_q.close()
+            old_result_q.close()
+            for _ in range(self.size):
+                self._spawn()
+            for job_id, (future, job) in pending.items():
+                if future is timed_out or future.done():
+                    continue
+                self._pending[job_id] = (future, job)
+                self.job_q.put(dict(job, id=job_id))
+        self._start_collector()
+        if timed_out is not None and not timed_out.done():
+            timed_out.set_result((False, None, "Render timed out; its worker was restarted"))
+
+
+_WORKER_POOL = ManimWorkerPool(size=2)
+
+
 class ManimAnimationGenerator:
     def __init__(self):
-        self.temp_dir = None
-        self.output_dir = None
-    
-    def setup_directories(self):
-        """Setup temporary directories for Manim execution"""
-        self.temp_dir = tempfile.mkdtemp()
-        self.output_dir = os.path.join(self.temp_dir, "media", "videos", "480p15")
-        os.makedirs(self.output_dir, exist_ok=True)
-        return self.temp_dir
-    
-    def cleanup_directories(self):
-        """Clean up temporary directories"""
-        if self.temp_dir and os.path.exists(self.temp_dir):
-            shutil.rmtree(self.temp_dir)
-            self.temp_dir = None
-            self.output_dir = None
-    
+        # One long-lived workdir instead of a fresh mkdtemp + rmtree per
+        # render: the media tree survives across renders and the per-call
+        # makedirs/unlink churn goes away. Each render writes its own
+        # uniquely named module inside it, so concurrent renders never
+        # clobber each other. Removed only at process exit.
+        self.work_root = tempfile.mkdtemp(prefix="manim_work_")
+        atexit.register(shutil.rmtree, self.work_root, ignore_errors=True)
+        self._render_seq = itertools.count()
+
+    def _finalize_render(self, permanent_file, cached_file, scene_media_dir):
+        """Blocking post-render bookkeeping, run in a worker thread."""
+        os.makedirs(_RENDER_CACHE_DIR, exist_ok=True)
+        shutil.copy2(permanent_file, cached_file)
+        _render_cache_evict()
+        # The outputs have been moved out, and the per-render stem means
+        # nothing under this subtree can ever be reused — drop it.
+        shutil.rmtree(scene_media_dir, ignore_errors=True)
+
+    async def _mp4_to_gif(self, mp4_path, gif_path):
+        """Convert a rendered MP4 to GIF with ffmpeg's palette filter."""
+        cmd = [
+            "ffmpeg", "-y", "-i", mp4_path,
+            "-vf", "fps=15,scale=480:-1:flags=lanczos,split[a][b];[a]palettegen[p];[b][p]paletteuse",
+            gif_path,
+        ]
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        _, stderr_b = await proc.communicate()
+        if proc.returncode != 0:
+            stderr = _bounded_logs(stderr_b.decode(errors="replace"))
+            raise RuntimeError(f"ffmpeg GIF conversion failed:\n{stderr}")
+        return gif_path
+
+
     def validate_manim_code(self, code):
         """Basic validation of Manim code"""
-        required_imports = ["from manim import *", "import manim"]
-        has_import = any(imp in code for imp in required_imports)
-        
-        if not has_import:
-            return False, "Code must include 'from manim import *' or 'import manim'"
-        
-        if "class" not in code:
-            return False, "Code must contain at least one class definition"
-        
-        if "Scene" not in code:
-            return False, "Class must inherit from Scene or a Scene subclass"
-        
-        return True, "Code validation passed"
+        is_valid, message, _ = _analyze_code(code)
+        return is_valid, message
     
     # def install_manim(self):
     #     """Try to install Manim if not available"""
@@ -184,7 +715,7 @@ class ManimAnimationGenerator:
     #     except subprocess.CalledProcessError as e:
     #         return False, f"Failed to install Manim: {str(e)}"
 
-    def execute_manim_code(self, code, quality="low", format_type="gif"):
+    async def execute_manim_code(self, code, quality="low", format_type="mp4", preview=False):
         """Execute Manim code and return the generated animation"""
         # if not MANIM_AVAILABLE:
         #     success, message = self.install_manim()
@@ -193,15 +724,28 @@ class ManimAnimationGenerator:
 
         code  = extract_manim_code(code)
 
+        cache_key = _render_cache_key(code, f"{quality}-preview" if preview else quality, format_type)
+        cached_file = os.path.join(_RENDER_CACHE_DIR, f"{cache_key}.{format_type}")
+        if os.path.exists(cached_file):
+            os.utime(cached_file, None)  # keep hot entries out of eviction
+            return cached_file, "✅ Animation loaded from render cache!", ""
+
         try:
             is_valid, message = self.validate_manim_code(code)
             if not is_valid:
                 return None, f"❌ Validation Error: {message}", ""
-            
-            temp_dir = self.setup_directories()
-            python_file = os.path.join(temp_dir, "animation.py")
+
+            # Unique module stem per render so concurrent renders in the
+            # shared workdir never collide on the same MyScene output —
+            # the sequence number covers two users rendering identical
+            # code at once (same cache key, e.g. the default example),
+            # which would otherwise share one media path and fight over
+            # the same partial movie files.
+            stem = f"animation_{cache_key[:12]}_{next(self._render_seq)}"
+            python_file = os.path.join(self.work_root, f"{stem}.py")
             with open(python_file, "w") as f:
                 f.write(code)
+            scene_media_dir = os.path.join(self.work_root, "media", "videos", stem)
 
         # try:
         #     is_valid, message = self.validate_manim_code(code)
@@ -237,73 +781,118 @@ class ManimAnimationGenerator:
         #         f.write(code)
             #end
             
-            class_name = self.extract_class_name(code)
-            if not class_name:
-                self.cleanup_directories()
+            class_names = self.extract_scene_classes(code)
+            if not class_names:
                 return None, "❌ Error: Could not find a valid Scene class in the code", ""
-            
-            quality_map = {"low": "-ql", "medium": "-qm", "high": "-qh"}
-            quality_flag = quality_map.get(quality, "-ql")
-            format_flag = "--format=gif" if format_type == "gif" else ""
-            
-            # cmd = [sys.executable, "-m", "manim", quality_flag, python_file, class_name]
-            cmd = [
-                sys.executable, "-m", "manim", 
-                "-ql",            # Low Quality (480p)
-                "--fps", "15",    # Lower FPS (Standard is 30 or 60, 15 is much lighter)
-                "--disable_caching", # CRITICAL: Prevents cache lock freezes
-                "--flush_cache",     # CRITICAL: Clears memory
-                python_file, 
-                class_name
-            ]
-            if format_flag:
-                cmd.append(format_flag)
-            
-            result = subprocess.run(
-                cmd,
-                cwd=temp_dir,
-                capture_output=True,
-                text=True,
-                timeout=120,
+
+            # Render every Scene class concurrently — each job goes to a
+            # pool worker, so multi-scene code finishes in roughly the
+            # time of the slowest scene instead of the sum.
+            results = await asyncio.gather(*[
+                self._render_scene(python_file, name, preview=preview)
+                for name in class_names
+            ])
+
+            logs_all = []
+            for name, (ok, _, scene_logs) in zip(class_names, results):
+                logs_all.append(scene_logs)
+                if not ok:
+                    error_msg = f"❌ Manim execution failed for {name}:\n{scene_logs}"
+                    return None, error_msg, "\n".join(logs_all)
+            logs = "\n".join(logs_all)
+
+            # Move every rendered scene out of the media tree; the first
+            # class remains the one shown in the UI. Manim always writes
+            # MP4 (threaded libx264); GIF requests are converted with
+            # ffmpeg's palette filter, which is far faster than Manim's
+            # own single-threaded GIF pipeline.
+            ts = int(time.time())
+            permanent_files = []
+            for name, (_, output_file, _) in zip(class_names, results):
+                if not output_file or not os.path.exists(output_file):
+                    resolution = "270p10" if preview else "480p15"
+                    output_file = self.find_output_file(scene_media_dir, name, "mp4", resolution)
+                if not output_file:
+                    return None, "❌ Error: Could not find generated animation file", logs
+                permanent_file = f"/tmp/{name}_{ts}.mp4"
+                await asyncio.to_thread(shutil.move, output_file, permanent_file)
+                if format_type == "gif":
+                    permanent_file = await self._mp4_to_gif(permanent_file, f"/tmp/{name}_{ts}.gif")
+                permanent_files.append(permanent_file)
+
+            # File copies, the cache-eviction scan and the workdir
+            # cleanup are all blocking I/O — keep them off the event loop.
+            await asyncio.to_thread(
+                self._finalize_render, permanent_files[0], cached_file, scene_media_dir
             )
-            
-            if result.returncode != 0:
-                error_msg = f"❌ Manim execution failed:\n{result.stderr}"
-                self.cleanup_directories()
-                return None, error_msg, result.stdout
-            
-            output_file = self.find_output_file(temp_dir, class_name, format_type)
-            if not output_file:
-                self.cleanup_directories()
-                return None, "❌ Error: Could not find generated animation file", result.stdout
-            
-            permanent_file = f"/tmp/{class_name}_{int(time.time())}.{format_type}"
-            shutil.copy2(output_file, permanent_file)
-            
+
             success_msg = f"✅ Animation generated successfully!"
-            self.cleanup_directories()
-            return permanent_file, success_msg, result.stdout
-            
-        except subprocess.TimeoutExpired:
-            self.cleanup_directories()
+            if len(permanent_files) > 1:
+                success_msg += f" ({len(permanent_files)} scenes rendered, showing {class_names[0]})"
+            return permanent_files[0], success_msg, logs
+
+        except asyncio.TimeoutError:
             return None, "❌ Error: Animation generation timed out (2 minutes)", ""
         except Exception as e:
-            self.cleanup_directories()
             return None, f"❌ An unexpected error occurred: {str(e)}", ""
-    
+
+    async def _render_scene(self, python_file, class_name, preview=False):
+        """Render a single scene class on the pre-forked worker pool."""
+        # Each render gets a unique module stem, so Manim's partial-file
+        # cache could never score a hit across renders — disable it and
+        # skip the per-animation hashing it would cost.
+        render_config = {
+            "media_dir": os.path.join(self.work_root, "media"),
+            "format": "mp4",
+            "disable_caching": True,
+        }
+        if preview:
+            # Fewer pixels × fewer frames: the rasterization loop is
+            # roughly linear in both, so 270p10 previews land fast.
+            render_config.update(pixel_width=480, pixel_height=270, frame_rate=10)
+        else:
+            render_config.update(quality="low_quality", frame_rate=15)
+
+        job_id, future = _WORKER_POOL.submit({
+            "file": python_file,
+            "module": Path(python_file).stem,
+            "class_name": class_name,
+            "config": render_config,
+        })
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=120)
+        except asyncio.TimeoutError:
+            # The worker is stuck inside runaway scene code; replace it.
+            _WORKER_POOL.restart(timed_out=future)
+            raise
+        except asyncio.CancelledError:
+            # Speculative renders get cancelled mid-flight; tell the
+            # pool so a worker skips the job instead of rendering a
+            # result nobody will read.
+            _WORKER_POOL.cancel(job_id)
+            raise
+
+    def extract_scene_classes(self, code):
+        """Return the names of all Scene subclasses, in source order."""
+        return list(_analyze_code(code)[2])
+
     def extract_class_name(self, code):
-        lines = code.split('\n')
-        for line in lines:
-            if line.strip().startswith('class ') and 'Scene' in line:
-                return line.strip().split('class ')[1].split('(')[0].strip()
-        return None
+        classes = self.extract_scene_classes(code)
+        return classes[0] if classes else None
 
-    def find_output_file(self, temp_dir, class_name, format_type):
-        for root, _, files in os.walk(temp_dir):
-            for file in files:
-                if file.startswith(class_name) and file.endswith(f".{format_type}"):
-                    return os.path.join(root, file)
-        return None
+    def find_output_file(self, scene_media_dir, class_name, format_type, resolution="480p15"):
+        """
+        Locate a rendered scene file. Manim writes to a deterministic
+        media/videos/<stem>/<resolution>/<ClassName>.<ext> path, so try
+        that directly instead of walking the whole tree (which also
+        visits every partial movie fragment); fall back to a glob in
+        case the resolution directory differs.
+        """
+        expected = os.path.join(scene_media_dir, resolution, f"{class_name}.{format_type}")
+        if os.path.exists(expected):
+            return expected
+        candidates = glob(os.path.join(scene_media_dir, "*", f"{class_name}.{format_type}"))
+        return candidates[0] if candidates else None
 
 # --- GRADIO APP FUNCTIONS ---
 
@@ -335,15 +924,15 @@ class TextAnimation(Scene):
 }
 
 
-def generate_animation(code, quality, format_type, progress=gr.Progress()):
+async def generate_animation(code, quality, format_type, progress=gr.Progress()):
     """Main function to generate animation from code."""
     if not code.strip():
         return None, "❌ Please enter or generate some Manim code.", ""
-    
+
     progress(0.1, desc="Starting animation generation...")
-    
+
     progress(0.3, desc="Executing Manim code...")
-    result_path, status_msg, logs = generator.execute_manim_code(code, quality, format_type)
+    result_path, status_msg, logs = await generator.execute_manim_code(code, quality, format_type)
     
     if result_path:
         progress(1.0, desc="Animation Ready!")
@@ -352,14 +941,53 @@ def generate_animation(code, quality, format_type, progress=gr.Progress()):
         return None, status_msg, logs
         
 
-def generate_full_process(prompt, quality, format_type):
+# In-flight coalescer: identical submissions arriving while a pipeline
+# is still running (a classroom clicking the same example at once)
+# share one backing task instead of spawning N duplicate LLM + render
+# pipelines.
+_INFLIGHT = {}
+
+
+async def generate_full_process(prompt, quality, format_type):
     """Generate Manim code and render video with live, user-friendly updates."""
+    key = hashlib.sha256(f"{prompt}|{quality}|{format_type}".encode()).hexdigest()
+    leader = _INFLIGHT.get(key)
+    if leader is not None:
+        yield None, "⏳ The same request is already in progress — sharing its result.", "", ""
+        yield await asyncio.shield(leader)
+        return
+
+    future = asyncio.get_running_loop().create_future()
+    _INFLIGHT[key] = future
+    last = (None, "⚠️ Request did not complete.", "", "")
+    try:
+        async for update in _full_pipeline(prompt, quality, format_type):
+            last = update
+            yield update
+    finally:
+        _INFLIGHT.pop(key, None)
+        if not future.done():
+            future.set_result(last)
+
+
+async def _full_pipeline(prompt, quality, format_type):
+    """The actual generate-then-render pipeline behind generate_full_process."""
 
     # Step 0: Initial notice
     yield None, "🤖 Thinking... generating Manim code based on your prompt.", "", ""
 
-    # Step 1: Generate AI code
-    code, msg = generate_code_from_prompt(prompt)
+    # Step 1: Stream AI code so users see it appear token by token.
+    # The network read is blocking, so pull each chunk in a thread to
+    # keep the event loop free for other users.
+    code, msg = "", ""
+    stream = stream_code_from_prompt(prompt)
+    while True:
+        item = await asyncio.to_thread(next, stream, None)
+        if item is None:
+            break
+        code, msg = item
+        if msg is None:
+            yield None, "🤖 Streaming Manim code from the AI...", code, ""
     if not code:
         yield None, f"⚠️ Couldn't generate code. {msg}", "", ""
         return
@@ -367,21 +995,47 @@ def generate_full_process(prompt, quality, format_type):
     # Step 2: Display the code immediately and prepare rendering
     yield None, "🧠 Manim code ready — preparing render environment.", code, ""
 
-    # Step 3: Rendering phase
-    yield None, "🎬 Rendering animation... this may take a moment.", code, ""
-    result_path, status_msg, logs = generator.execute_manim_code(code, quality, format_type)
+    # Step 3: Fast low-res preview first, so something playable appears
+    # quickly; a preview failure also fails fast before the full render.
+    yield None, "🎬 Rendering a quick preview...", code, ""
+    preview_path, preview_status, preview_logs = await generator.execute_manim_code(
+        code, quality, format_type, preview=True
+    )
+    if not preview_path:
+        yield None, f"❌ Something went wrong while rendering. Details: {preview_status}", code, preview_logs
+        return
+    yield preview_path, "⚡ Preview ready — rendering full quality...", code, preview_logs
 
-    # Step 4: Final stage
+    # Step 4: Full-quality render replaces the preview when it lands
+    result_path, status_msg, logs = await generator.execute_manim_code(code, quality, format_type)
     if result_path:
         yield result_path, "✅ Rendering complete! Previewing your animation...", code, logs
     else:
-        yield None, f"❌ Something went wrong while rendering. Details: {status_msg}", code, logs
+        yield preview_path, f"❌ Full-quality render failed; showing the preview. Details: {status_msg}", code, logs
+
+async def edit_and_render(existing_code, instruction, quality, format_type, progress=gr.Progress()):
+    # Run the LLM edit and a speculative render of the current code
+    # concurrently: if the model hands the code back unchanged (or the
+    # render cache already holds it) the video is ready the moment the
+    # edit lands; otherwise the speculative render is cancelled and the
+    # edited code is rendered instead.
+    edit_task = asyncio.create_task(asyncio.to_thread(
+        edit_code_with_instruction, existing_code, instruction, progress
+    ))
+    prerender_task = asyncio.create_task(
+        generator.execute_manim_code(existing_code, quality, format_type)
+    )
 
-def edit_and_render(existing_code, instruction, quality, format_type, progress=gr.Progress()):
-    edited_code, status = edit_code_with_instruction(existing_code, instruction, progress)
+    edited_code, status = await edit_task
     if not edited_code.strip():
+        prerender_task.cancel()
         return None, status, existing_code, ""
-    result_path, render_status, logs = generator.execute_manim_code(edited_code, quality, format_type)
+
+    if extract_manim_code(edited_code).strip() == extract_manim_code(existing_code).strip():
+        result_path, render_status, logs = await prerender_task
+    else:
+        prerender_task.cancel()
+        result_path, render_status, logs = await generator.execute_manim_code(edited_code, quality, format_type)
     return result_path, f"{status}\n{render_status}", edited_code, logs
 
 
@@ -508,12 +1162,14 @@ with gr.Blocks(theme=gr.themes.Soft(),
     fn=generate_full_process,
     inputs=[prompt_input, quality, format_type],
     outputs=[output_video, status_output, code_input, logs_output],
+    concurrency_limit=4,
     )
 
     rerender_btn.click(
     fn=generate_animation,
     inputs=[code_input, quality, format_type],
-    outputs=[output_video, status_output, logs_output]
+    outputs=[output_video, status_output, logs_output],
+    concurrency_limit=4,
     )
 
     # edit_code_btn.click(
@@ -525,7 +1181,8 @@ with gr.Blocks(theme=gr.themes.Soft(),
     edit_code_btn.click(
         fn=edit_and_render,
         inputs=[code_input, edit_instruction, quality, format_type],
-        outputs=[output_video, status_output, code_input, logs_output]
+        outputs=[output_video, status_output, code_input, logs_output],
+        concurrency_limit=4,
     )
     
     # load_example_btn.click(
@@ -538,5 +1195,9 @@ with gr.Blocks(theme=gr.themes.Soft(),
     hide_logs_btn.click(fn=lambda: gr.update(visible=False), outputs=[logs_output])
 
 if __name__ == "__main__":
+    # Fork the render workers before serving so the Manim import cost
+    # is paid while Gradio is still booting, not on the first render.
+    _WORKER_POOL.start()
     port = int(os.environ.get("PORT", 7860))
+    app.queue(max_size=64, default_concurrency_limit=4)
     app.launch(server_name="0.0.0.0", server_port=port)